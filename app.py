@@ -1,10 +1,15 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
 import pandas as pd
-import pickle
 from pathlib import Path
 from data_processor import (
+    COLUMN_MAPPINGS,
     extract_all_dimensions,
     get_dimension_summary,
+    precompute_dimension_sums,
     aggregate_single,
     aggregate_cross,
 )
@@ -44,22 +49,20 @@ st.markdown(
 # 缓存管理
 CACHE_DIR = Path(".streamlit_cache")
 CACHE_DIR.mkdir(exist_ok=True)
-CACHE_FILE = CACHE_DIR / "df_extracted.pkl"
+CACHE_FILE = CACHE_DIR / "df_extracted.parquet"
 
 def save_df_cache(df):
-    """保存提取后的数据到文件"""
+    """保存提取后的数据到 Parquet 文件（列式存储 + zstd 压缩）"""
     try:
-        with open(CACHE_FILE, 'wb') as f:
-            pickle.dump(df, f)
+        df.to_parquet(CACHE_FILE, engine='pyarrow', compression='zstd', index=False)
     except Exception as e:
         st.warning(f"⚠️ 数据缓存保存失败: {str(e)}")
 
-def load_df_cache():
-    """从文件加载提取后的数据"""
+def load_df_cache(filters=None):
+    """从 Parquet 文件加载数据；filters 会下推到行组级别，只读取匹配的子集"""
     try:
         if CACHE_FILE.exists():
-            with open(CACHE_FILE, 'rb') as f:
-                return pickle.load(f)
+            return pd.read_parquet(CACHE_FILE, engine='pyarrow', filters=filters)
     except Exception as e:
         st.warning(f"⚠️ 数据缓存加载失败: {str(e)}")
     return None
@@ -72,12 +75,96 @@ def clear_df_cache():
     except Exception as e:
         st.warning(f"⚠️ 缓存清除失败: {str(e)}")
 
-# 初始化 session state
-if 'df' not in st.session_state:
-    st.session_state.df = None
+# 指标列的目标 dtype：计数列用可空 Int64（兼容空单元格），金额列用 float64
+_METRIC_DTYPES = {
+    'impressions': 'Int64',
+    'click': 'Int64',
+    'conversions': 'Int64',
+    'spend': 'float64',
+    'sales': 'float64',
+}
+
+def _build_dtype_map(columns) -> dict:
+    """根据表头为已知指标列生成显式 dtype
+
+    不显式指定时，含空单元格的数值列会被推断成 object，
+    后续的分组求和与派生指标就退化为逐对象运算。
+    """
+    dtype_map = {}
+    for key, possible_names in COLUMN_MAPPINGS.items():
+        for col_name in possible_names:
+            if col_name in columns:
+                dtype_map[col_name] = _METRIC_DTYPES[key]
+                break
+    return dtype_map
+
+def read_excel_fast(buffer) -> pd.DataFrame:
+    """读取 Excel：优先使用 Rust 实现的 calamine 引擎（比默认的纯 Python 解析快一个量级），
+    未安装 python-calamine 时回退到默认引擎；先用仅表头的一次读取确定指标列的显式 dtype"""
+    try:
+        header = pd.read_excel(buffer, nrows=0, engine='calamine')
+        engine = 'calamine'
+    except ImportError:
+        buffer.seek(0)
+        header = pd.read_excel(buffer, nrows=0)
+        engine = None
+    buffer.seek(0)
+
+    dtype_map = _build_dtype_map(header.columns)
+    if engine is not None:
+        return pd.read_excel(buffer, engine=engine, dtype=dtype_map)
+    return pd.read_excel(buffer, dtype=dtype_map)
+
+# 三个维度列的列名（提取后的数据框 = 原始列 + 这三列）
+DIMENSION_COLS = ['Parent Code', 'Pattern', 'Attribute']
+
+# 单 worker 线程池：Excel 解析放到后台线程，解析期间 Streamlit 会话保持可交互
+@st.cache_resource
+def get_parse_executor() -> ThreadPoolExecutor:
+    """进程内共享的解析线程池（st.cache_resource 保证只建一次）"""
+    return ThreadPoolExecutor(max_workers=1)
+
+# Streamlit 层缓存：同一输入的重复 rerun（点击控件、打开详情页）直接复用计算结果
+@st.cache_data(show_spinner=False)
+def cached_load_and_extract(file_bytes: bytes, file_name: str):
+    """按上传文件的字节内容缓存 读取 + 维度提取 + 摘要 的完整流水线
+
+    只返回提取后的数据框（已含全部原始列），不再额外保留一份原始数据框。
+    """
+    df_extracted = extract_all_dimensions(read_excel_fast(io.BytesIO(file_bytes)))
+    summary = get_dimension_summary(df_extracted)
+    return df_extracted, summary
+
+@st.cache_data(show_spinner=False)
+def cached_dimension_sums(_df: pd.DataFrame, file_name: str):
+    """按文件名缓存三个维度的分组求和结果"""
+    return precompute_dimension_sums(_df)
+
+@st.cache_data(show_spinner=False)
+def cached_aggregate_single(_df: pd.DataFrame, dimension: str, file_name: str,
+                            _presummed=None) -> pd.DataFrame:
+    """按 (文件名, 维度) 缓存单维度聚合结果；下划线前缀参数不参与 Streamlit 哈希"""
+    return aggregate_single(_df, dimension, presummed=_presummed)
+
+@st.cache_data(show_spinner=False)
+def cached_detail_data(cache_mtime: int, dimension: str, value: str):
+    """按 (缓存文件修改时间, 维度, 值) 缓存详情页数据
+
+    键里带上 Parquet 文件的 mtime，新文件写入缓存后旧条目自动失效，
+    无需手动清理；重复打开同一链接是 O(1) 的缓存命中。
+    """
+    # 过滤条件下推到 Parquet 读取层，只反序列化匹配的行组
+    df_filtered = load_df_cache(filters=[(dimension, '==', value)])
+    if df_filtered is None:
+        return None, None
+    if df_filtered.empty:
+        return df_filtered, None
+    return df_filtered, aggregate_single(df_filtered, dimension)
+
+# 初始化 session state（数据本身由 st.cache_data 和 Parquet 缓存托管，不在这里重复保留）
+if 'file_name' not in st.session_state:
     st.session_state.file_name = None
-    st.session_state.df_extracted = None
-    st.session_state.summary = None
+    st.session_state.cache_saved = False
 
 # 详情页面处理
 def show_detail_page(dimension, value):
@@ -85,23 +172,18 @@ def show_detail_page(dimension, value):
     st.title(f"📊 {dimension} 详情页")
     st.markdown(f"### {dimension}: **{value}**")
 
-    # 从缓存加载数据
-    df_extracted = load_df_cache()
-    if df_extracted is None:
+    # 从缓存加载数据（以缓存文件 mtime 作为失效键，重复 rerun 不再重读 Parquet）
+    cache_mtime = CACHE_FILE.stat().st_mtime_ns if CACHE_FILE.exists() else 0
+    df_filtered, summary_data = cached_detail_data(cache_mtime, dimension, value)
+    if df_filtered is None:
         st.error("❌ 无法加载数据，请返回主页面重新上传文件")
         return
 
-    # 过滤数据
-    df_filtered = df_extracted[df_extracted[dimension] == value]
-
     if df_filtered.empty:
         st.warning(f"⚠️ 未找到 {dimension}='{value}' 的数据")
         return
 
-    # 显示该维度值的聚合总结
-    summary_data = aggregate_single(df_filtered, dimension)
-
-    if not summary_data.empty:
+    if summary_data is not None and not summary_data.empty:
         st.markdown("### 📈 汇总数据")
         st.dataframe(
             summary_data,
@@ -115,8 +197,21 @@ def show_detail_page(dimension, value):
     # 移除 Parent Code 和 Pattern 列（如果存在）以简化显示
     display_cols = [col for col in df_filtered.columns
                    if col not in ['Parent Code', 'Pattern']]
+
+    # 分页展示：每次只把当前页序列化给前端，行数多时明细表不再拖慢页面
+    page_size = 200
+    total_pages = (len(df_filtered) + page_size - 1) // page_size
+    if total_pages > 1:
+        page = st.number_input(
+            f"页码（共 {total_pages} 页，每页 {page_size} 行，合计 {len(df_filtered)} 行）",
+            min_value=1, max_value=total_pages, value=1, step=1,
+        )
+    else:
+        page = 1
+
+    start = (page - 1) * page_size
     st.dataframe(
-        df_filtered[display_cols],
+        df_filtered.iloc[start:start + page_size][display_cols],
         use_container_width=True,
         hide_index=True,
     )
@@ -150,48 +245,52 @@ if uploaded_file is not None:
     # 【关键修复】检测是否是新文件，如果是则清除旧缓存
     if st.session_state.file_name != uploaded_file.name:
         st.session_state.file_name = uploaded_file.name
-        st.session_state.df = None
-        st.session_state.df_extracted = None
-        st.session_state.summary = None
+        st.session_state.cache_saved = False
         clear_df_cache()  # 清除旧缓存
+        st.cache_data.clear()  # 同步清空 Streamlit 层缓存
         st.sidebar.info("✅ 检测到新文件，已清除旧缓存")
 
-    # 读取 Excel 文件
-    try:
-        df = pd.read_excel(uploaded_file)
-        st.session_state.df = df
+    # 读取 Excel 文件并提取维度：提交到后台线程执行，主线程轮询直到完成，
+    # 解析期间页面不被阻塞；结果仍按文件内容缓存，重复 rerun 不重算
+    parse_future = st.session_state.get('parse_future')
+    if parse_future is None or st.session_state.get('parse_file') != uploaded_file.name:
+        parse_future = get_parse_executor().submit(
+            cached_load_and_extract, uploaded_file.getvalue(), uploaded_file.name
+        )
+        st.session_state.parse_future = parse_future
+        st.session_state.parse_file = uploaded_file.name
 
-        # 显示文件信息
-        with st.sidebar.expander("📊 文件信息"):
-            st.write(f"**文件名**: {uploaded_file.name}")
-            st.write(f"**行数**: {len(df)}")
-            st.write(f"**列数**: {len(df.columns)}")
-            st.write(f"**列名**: {', '.join(df.columns)}")
+    if not parse_future.done():
+        st.info("⏳ 正在后台解析 Excel 文件，页面仍可操作...")
+        time.sleep(0.3)
+        st.rerun()
 
+    try:
+        df_extracted, summary = parse_future.result()
     except Exception as e:
+        st.session_state.parse_future = None
         st.error(f"❌ 文件读取失败: {str(e)}")
         st.stop()
 
-    # 数据提取
-    if st.session_state.df_extracted is None:
-        with st.spinner("⏳ 正在提取维度..."):
-            try:
-                df_extracted = extract_all_dimensions(st.session_state.df)
-                st.session_state.df_extracted = df_extracted
-                st.session_state.summary = get_dimension_summary(df_extracted)
-
-                # 保存到缓存文件，以便详情页可以访问
-                save_df_cache(df_extracted)
+    # 原始列 = 提取后的数据框去掉三个维度列，无需单独保留一份原始数据框
+    raw_cols = [col for col in df_extracted.columns if col not in DIMENSION_COLS]
 
-            except Exception as e:
-                st.error(f"❌ 维度提取失败: {str(e)}")
-                st.stop()
+    # 显示文件信息
+    with st.sidebar.expander("📊 文件信息"):
+        st.write(f"**文件名**: {uploaded_file.name}")
+        st.write(f"**行数**: {len(df_extracted)}")
+        st.write(f"**列数**: {len(raw_cols)}")
+        st.write(f"**列名**: {', '.join(raw_cols)}")
 
+    if not st.session_state.cache_saved:
+        # 保存到缓存文件，以便详情页可以访问
+        save_df_cache(df_extracted)
+        st.session_state.cache_saved = True
         st.success("✅ 维度提取完成")
 
     # 显示原始数据预览
     with st.expander("📋 原始数据预览", expanded=False):
-        st.dataframe(st.session_state.df, use_container_width=True, hide_index=True)
+        st.dataframe(df_extracted[raw_cols], use_container_width=True, hide_index=True)
 
     st.markdown("---")
 
@@ -200,16 +299,16 @@ if uploaded_file is not None:
 
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Parent Code 个数", st.session_state.summary['parent_code_count'])
+        st.metric("Parent Code 个数", summary['parent_code_count'])
     with col2:
-        st.metric("Pattern 个数", st.session_state.summary['pattern_count'])
+        st.metric("Pattern 个数", summary['pattern_count'])
     with col3:
-        st.metric("Attribute 个数", st.session_state.summary['attribute_count'])
+        st.metric("Attribute 个数", summary['attribute_count'])
 
     # 显示提取后的数据
     with st.expander("📄 提取后的数据", expanded=False):
         st.dataframe(
-            st.session_state.df_extracted,
+            df_extracted,
             use_container_width=True,
             hide_index=True,
         )
@@ -229,7 +328,13 @@ if uploaded_file is not None:
     if st.button("🔍 执行分析"):
         with st.spinner(f"⏳ 正在分析 {dimension}..."):
             try:
-                result = aggregate_single(st.session_state.df_extracted, dimension)
+                presummed = cached_dimension_sums(
+                    df_extracted, st.session_state.file_name
+                ).get(dimension)
+                result = cached_aggregate_single(
+                    df_extracted, dimension,
+                    st.session_state.file_name, _presummed=presummed,
+                )
 
                 if result.empty:
                     st.warning(f"⚠️ 未找到 {dimension} 的分析结果")
@@ -249,21 +354,24 @@ if uploaded_file is not None:
                     if spend_col:
                         result = result.sort_values(by=spend_col, ascending=False)
 
-                    # 【重要】转换为 HTML 表格，在第一列显示超链接
+                    # 【重要】第一列渲染为详情页超链接：向量化拼 URL，交给 LinkColumn 显示
                     df_display = result.copy()
                     dimension_col = df_display.columns[0]
-
-                    # 生成 HTML 表格，第一列为超链接
-                    def make_clickable(value):
-                        # 确保 value 是字符串类型
-                        value_str = str(value)
-                        return f'<a href="?dimension={dimension}&value={value_str}" target="_blank">{value_str}</a>'
-
-                    df_display[dimension_col] = df_display[dimension_col].apply(make_clickable)
-
-                    # 转换为 HTML 并显示
-                    html_table = df_display.to_html(escape=False, index=False)
-                    st.markdown(html_table, unsafe_allow_html=True)
+                    df_display[dimension_col] = (
+                        f"?dimension={dimension}&value="
+                        + df_display[dimension_col].astype(str)
+                    )
+
+                    st.dataframe(
+                        df_display,
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config={
+                            dimension_col: st.column_config.LinkColumn(
+                                dimension_col, display_text=r"value=(.*)"
+                            )
+                        },
+                    )
 
             except Exception as e:
                 st.error(f"❌ 分析失败: {str(e)}")
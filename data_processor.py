@@ -7,10 +7,105 @@ SP广告数据分析工具 - 数据处理模块
 3. 支持单维度和交叉维度分析
 """
 
+import functools
+import re
+
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Tuple, Optional
 
+# 广告活动名称的前三个 token（模块加载时编译一次，供 str.extract 复用）
+_DIMENSION_RE = re.compile(r'^\s*(\S+)(?:\s+(\S+))?(?:\s+(\S+))?')
+
+# 关键指标列的可能列名映射（支持中英文变体）
+COLUMN_MAPPINGS = {
+    'impressions': ['Impressions', '曝光量', '展示'],
+    'click': ['Clicks', 'Click', '点击', '点击数'],
+    'spend': ['Spend', 'Spend ($)', '花费', '支出'],
+    'sales': ['Sales', '销售额', '销售'],
+    'conversions': ['Conversions', '转化', '转化数']
+}
+
+
+@functools.lru_cache(maxsize=8)
+def _resolve_columns(columns: Tuple[str, ...]) -> Dict[str, str]:
+    """
+    从列名元组解析出实际存在的指标列
+
+    键是列名元组，同一数据框结构的重复聚合直接命中缓存。
+    """
+    column_set = set(columns)
+    actual = {}
+    for key, possible_names in COLUMN_MAPPINGS.items():
+        for col_name in possible_names:
+            if col_name in column_set:
+                actual[key] = col_name
+                break
+    return actual
+
+# numbagg（基于 Numba JIT 的分组聚合内核）为可选加速项，未安装时走 pandas 原生路径
+try:
+    import numbagg
+except ImportError:
+    numbagg = None
+
+# pyarrow 的 C++ 字符串内核比 pandas 的 Python 字符串路径快 5-10 倍，未安装时回退正则
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+
+def _split_campaign_tokens(series: pd.Series) -> pd.DataFrame:
+    """
+    取广告活动名称的前三个空白分隔 token，返回 0/1/2 三列（缺失为 NaN）
+
+    有 pyarrow 时走 Arrow 的向量化分词内核，否则用预编译正则的 str.extract。
+    """
+    values = series.astype("string")
+
+    if pa is not None:
+        arr = pc.utf8_trim_whitespace(pa.Array.from_pandas(values))
+        tokens = pc.utf8_split_whitespace(arr, max_splits=3)
+        # 补齐为定长 3 的列表后按下标取列，短列表的空位是 null
+        tokens = pc.list_slice(tokens, 0, 3, return_fixed_size_list=True)
+        parts = pd.DataFrame({
+            i: pc.list_element(tokens, i).to_pandas() for i in range(3)
+        })
+        # 空字符串 token（如整行为空白）与 null 同样视为缺失
+        return parts.replace("", pd.NA)
+
+    return values.str.extract(_DIMENSION_RE)
+
+
+def _group_sum(df: pd.DataFrame, key: str, numeric_cols: List[str]) -> pd.DataFrame:
+    """
+    按单个键对数值列分组求和
+
+    有 numbagg 时走 JIT 编译的并行内核（factorize + group_nansum），
+    否则回退到 pandas 的 groupby().sum()。
+    """
+    if numbagg is not None and numeric_cols:
+        codes, uniques = pd.factorize(df[key], sort=False)
+        sums = numbagg.group_nansum(
+            df[numeric_cols].to_numpy(dtype=np.float64),
+            codes, num_labels=len(uniques), axis=0,
+        )
+        # numbagg 把被聚合的轴移到末尾，输出是 (列数, 组数)，转置回 (组数, 列数)
+        result = pd.DataFrame(sums.T, columns=numeric_cols)
+        # 整数列求和后保持整数，且可空 Int64 输入保持 Int64，与 pandas 路径的输出一致
+        for col in numeric_cols:
+            if pd.api.types.is_integer_dtype(df[col]):
+                is_nullable = pd.api.types.is_extension_array_dtype(df[col].dtype)
+                result[col] = result[col].astype('Int64' if is_nullable else 'int64')
+        result.insert(0, key, uniques)
+        return result
+
+    # sort=False 跳过 groupby 内部按键排序（结果由调用方统一排序一次），
+    # as_index=False 直接产出普通列，省掉 reset_index 的一次拷贝
+    return df.groupby(key, sort=False, observed=True, as_index=False)[numeric_cols].sum()
+
 
 def extract_parent_code(campaign_name: str) -> str:
     """
@@ -68,23 +163,25 @@ def extract_all_dimensions(df: pd.DataFrame) -> pd.DataFrame:
     返回:
         包含新维度列的数据框
     """
-    df_copy = df.copy()
-
     # 确定广告活动列名（支持中英文）
     campaign_col = None
-    if 'Campaign Name' in df_copy.columns:
+    if 'Campaign Name' in df.columns:
         campaign_col = 'Campaign Name'
-    elif '广告活动' in df_copy.columns:
+    elif '广告活动' in df.columns:
         campaign_col = '广告活动'
     else:
         raise ValueError("数据框中未找到 'Campaign Name' 或 '广告活动' 列")
 
-    # 提取维度
-    df_copy['Parent Code'] = df_copy[campaign_col].apply(extract_parent_code)
-    df_copy['Pattern'] = df_copy[campaign_col].apply(extract_pattern)
-    df_copy['Attribute'] = df_copy[campaign_col].apply(extract_attribute)
+    # 提取维度：一次向量化分词取出前三个 token，缺失的统一落到 fillna
+    parts = _split_campaign_tokens(df[campaign_col]).fillna("未分类")
 
-    return df_copy
+    # assign 只分配三个新列，原有数值块与输入共享内存，避免整表深拷贝
+    # 维度列转为 category：后续 groupby 直接复用已有的因子化结果，缓存文件也更小
+    return df.assign(**{
+        'Parent Code': parts[0].astype('category'),
+        'Pattern': parts[1].astype('category'),
+        'Attribute': parts[2].astype('category'),
+    })
 
 
 def get_dimension_summary(df: pd.DataFrame) -> Dict[str, int]:
@@ -140,96 +237,121 @@ def format_value(value: float, metric_type: str) -> str:
         return str(value)
 
 
-def aggregate_single(df: pd.DataFrame, dimension: str) -> pd.DataFrame:
+def format_metric_series(values, metric_type: str) -> np.ndarray:
     """
-    按单个维度进行聚合分析
+    向量化版 format_value：一次性格式化整列数值
 
     参数:
-        df: 包含维度列的数据框
-        dimension: 维度名称 ('Parent Code', 'Pattern', 'Attribute')
+        values: 数值序列（Series 或 ndarray）
+        metric_type: 指标类型 ('percent', 'currency', 'ratio', 'number')
 
     返回:
-        聚合结果数据框
+        格式化后的字符串数组（NaN -> "-"，无穷大 -> "∞"）
     """
+    arr = np.asarray(values, dtype=np.float64)
 
-    # 验证维度
-    if dimension not in ['Parent Code', 'Pattern', 'Attribute']:
-        raise ValueError(f"无效的维度: {dimension}")
+    if metric_type == 'percent':
+        out = np.char.add(np.char.mod('%.2f', arr), '%')
+    elif metric_type == 'currency':
+        out = np.char.add('¥', np.char.mod('%.2f', arr))
+    elif metric_type == 'ratio':
+        out = np.char.add(np.char.mod('%.2f', arr), 'x')
+    elif metric_type == 'number':
+        out = np.char.mod('%d', np.nan_to_num(arr))
+    else:
+        out = arr.astype(str)
 
-    # 让类型系统告诉我们哪些列可以聚合 - 消除特殊情况
-    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    sum_columns = {col: 'sum' for col in numeric_cols}
+    # 特殊值与 format_value 保持一致
+    out = np.where(np.isinf(arr), "∞", out)
+    out = np.where(np.isnan(arr), "-", out)
+    return out
 
-    # 执行分组和求和
-    result = df.groupby(dimension).agg(sum_columns).reset_index()
 
-    # 计算派生指标（需要原始数据中有特定列）
-    # 确定关键列名称（可能有不同的变体）
-
-    # 定义可能的列名映射
-    column_mappings = {
-        'impressions': ['Impressions', '曝光量', '展示'],
-        'click': ['Clicks', 'Click', '点击', '点击数'],
-        'spend': ['Spend', 'Spend ($)', '花费', '支出'],
-        'sales': ['Sales', '销售额', '销售'],
-        'conversions': ['Conversions', '转化', '转化数']
+def precompute_dimension_sums(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    一次性计算三个维度各自的数值列分组求和
+
+    分组求和的主要开销在键的因子化上；提取完成后统一算一遍，
+    之后每个维度的 aggregate_single 都可以直接复用，无需再扫全表。
+
+    参数:
+        df: 包含维度列的数据框
+
+    返回:
+        {维度名: 分组求和结果} 的字典
+    """
+    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    return {
+        dim: _group_sum(df, dim, numeric_cols)
+        for dim in ('Parent Code', 'Pattern', 'Attribute')
     }
 
-    # 找到实际存在的列
-    actual_columns = {}
-    for key, possible_names in column_mappings.items():
-        for col_name in possible_names:
-            if col_name in result.columns:
-                actual_columns[key] = col_name
-                break
 
-    # 计算 CTR（点击率）= (点击 / 曝光) × 100
-    if 'click' in actual_columns and 'impressions' in actual_columns:
-        click_col = actual_columns['click']
-        imp_col = actual_columns['impressions']
-        result['CTR'] = (result[click_col] / result[imp_col] * 100).apply(
-            lambda x: format_value(x, 'percent') if pd.notna(x) else "-"
-        )
+def aggregate_single(df: pd.DataFrame, dimension: str,
+                     presummed: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    按单个维度进行聚合分析
 
-    # 计算 CPC（单次点击成本）= 花费 / 点击
-    if 'spend' in actual_columns and 'click' in actual_columns:
-        spend_col = actual_columns['spend']
-        click_col = actual_columns['click']
-        result['CPC'] = (result[spend_col] / result[click_col]).apply(
-            lambda x: format_value(x, 'currency') if pd.notna(x) else "-"
-        )
+    参数:
+        df: 包含维度列的数据框
+        dimension: 维度名称 ('Parent Code', 'Pattern', 'Attribute')
+        presummed: 可选，precompute_dimension_sums 算好的该维度分组求和结果
 
-    # 计算 ROAS（广告支出回报率）= 销售额 / 花费
-    if 'sales' in actual_columns and 'spend' in actual_columns:
-        sales_col = actual_columns['sales']
-        spend_col = actual_columns['spend']
-        result['ROAS'] = (result[sales_col] / result[spend_col]).apply(
-            lambda x: format_value(x, 'ratio') if pd.notna(x) else "-"
-        )
+    返回:
+        聚合结果数据框
+    """
 
-    # 计算 ACoS（广告成本占比）= (花费 / 销售额) × 100
-    if 'spend' in actual_columns and 'sales' in actual_columns:
-        spend_col = actual_columns['spend']
-        sales_col = actual_columns['sales']
-        result['ACoS'] = (result[spend_col] / result[sales_col] * 100).apply(
-            lambda x: format_value(x, 'percent') if pd.notna(x) else "-"
-        )
+    # 验证维度
+    if dimension not in ['Parent Code', 'Pattern', 'Attribute']:
+        raise ValueError(f"无效的维度: {dimension}")
 
-    # 计算 CVR（转化率）= (转化 / 点击) × 100
-    if 'conversions' in actual_columns and 'click' in actual_columns:
-        conv_col = actual_columns['conversions']
-        click_col = actual_columns['click']
-        result['CVR'] = (result[conv_col] / result[click_col] * 100).apply(
-            lambda x: format_value(x, 'percent') if pd.notna(x) else "-"
-        )
+    if presummed is not None:
+        # 复用预先算好的分组求和，跳过重复的因子化
+        result = presummed.copy()
+    else:
+        # 让类型系统告诉我们哪些列可以聚合 - 消除特殊情况
+        numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
 
-    # 计算 CPA（单次转化成本）= 花费 / 转化
-    if 'spend' in actual_columns and 'conversions' in actual_columns:
-        spend_col = actual_columns['spend']
-        conv_col = actual_columns['conversions']
-        result['CPA'] = (result[spend_col] / result[conv_col]).apply(
-            lambda x: format_value(x, 'currency') if pd.notna(x) else "-"
-        )
+        # 执行分组和求和（有 numbagg 时走 JIT 内核）
+        result = _group_sum(df, dimension, numeric_cols)
+
+    # 计算派生指标（需要原始数据中有特定列）
+    # 确定关键列名称：按列名元组查缓存，重复聚合不再重扫列表
+    actual_columns = _resolve_columns(tuple(result.columns))
+
+    # 把关键数值列一次性取成连续的 float64 数组，六个派生指标共用同一趟内存扫描
+    metric_keys = [k for k in ('impressions', 'click', 'spend', 'sales', 'conversions')
+                   if k in actual_columns]
+    vals = {}
+    if metric_keys:
+        arr = result[[actual_columns[k] for k in metric_keys]].to_numpy(dtype=np.float64)
+        vals = {k: arr[:, i] for i, k in enumerate(metric_keys)}
+
+    # 在一个代码块内计算全部派生指标，除零/0除0 直接产生 inf/NaN，由格式化统一处理
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # CTR（点击率）= (点击 / 曝光) × 100
+        if 'click' in vals and 'impressions' in vals:
+            result['CTR'] = format_metric_series(vals['click'] / vals['impressions'] * 100, 'percent')
+
+        # CPC（单次点击成本）= 花费 / 点击
+        if 'spend' in vals and 'click' in vals:
+            result['CPC'] = format_metric_series(vals['spend'] / vals['click'], 'currency')
+
+        # ROAS（广告支出回报率）= 销售额 / 花费
+        if 'sales' in vals and 'spend' in vals:
+            result['ROAS'] = format_metric_series(vals['sales'] / vals['spend'], 'ratio')
+
+        # ACoS（广告成本占比）= (花费 / 销售额) × 100
+        if 'spend' in vals and 'sales' in vals:
+            result['ACoS'] = format_metric_series(vals['spend'] / vals['sales'] * 100, 'percent')
+
+        # CVR（转化率）= (转化 / 点击) × 100
+        if 'conversions' in vals and 'click' in vals:
+            result['CVR'] = format_metric_series(vals['conversions'] / vals['click'] * 100, 'percent')
+
+        # CPA（单次转化成本）= 花费 / 转化
+        if 'spend' in vals and 'conversions' in vals:
+            result['CPA'] = format_metric_series(vals['spend'] / vals['conversions'], 'currency')
 
     # 重新排列列，确保维度列在第一列
     cols = [dimension]
@@ -263,12 +385,10 @@ def aggregate_cross(df: pd.DataFrame, dim1: str, dim2: str) -> pd.DataFrame:
     if dim1 == dim2:
         raise ValueError("两个维度不能相同")
 
-    # 让类型系统告诉我们哪些列可以聚合 - 消除特殊情况
-    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    sum_columns = {col: 'sum' for col in numeric_cols}
-
-    # 执行分组和求和
-    result = df.groupby([dim1, dim2]).agg(sum_columns).reset_index()
+    # 执行分组和求和：sum(numeric_only=True) 直接走类型化的求和内核，
+    # 非数值列自动排除，无需先构造逐列的 agg 字典（sort=False：排序交给末尾统一做）
+    result = df.groupby([dim1, dim2], sort=False, observed=True,
+                        as_index=False).sum(numeric_only=True)
 
     # 按第一个维度排序
     result = result.sort_values(by=[dim1, dim2]).reset_index(drop=True)
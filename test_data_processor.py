@@ -0,0 +1,36 @@
+"""
+_group_sum 的 numbagg 快速路径与 pandas 原生路径的一致性测试
+"""
+
+import pandas as pd
+import pytest
+
+import data_processor
+from data_processor import _group_sum
+
+
+@pytest.mark.skipif(data_processor.numbagg is None, reason="numbagg 未安装")
+def test_group_sum_numbagg_matches_pandas(monkeypatch):
+    # 组数（3）与数值列数（4）刻意不同：转置错误会直接报形状不匹配，而不是静默转置
+    df = pd.DataFrame({
+        'Parent Code': pd.Categorical(
+            ['SP-US', 'SP-US', 'SP-DE', 'SP-JP', 'SP-DE']
+        ),
+        'Impressions': pd.array([100, 200, 300, 400, 500], dtype='Int64'),
+        'Clicks': pd.array([1, 2, 3, None, 5], dtype='Int64'),
+        'Spend': [1.5, 2.5, 3.0, 4.0, 0.5],
+        'Sales': [10.0, 0.0, 5.0, 2.0, 1.0],
+    })
+    numeric_cols = ['Impressions', 'Clicks', 'Spend', 'Sales']
+
+    fast = _group_sum(df, 'Parent Code', numeric_cols)
+
+    # 屏蔽 numbagg 走 pandas 路径作为基准
+    monkeypatch.setattr(data_processor, 'numbagg', None)
+    baseline = _group_sum(df, 'Parent Code', numeric_cols)
+
+    pd.testing.assert_frame_equal(
+        fast.sort_values('Parent Code').reset_index(drop=True),
+        baseline.sort_values('Parent Code').reset_index(drop=True),
+        check_categorical=False,
+    )